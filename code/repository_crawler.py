@@ -1,32 +1,364 @@
 import os
-import json
+import re
 import yaml
 import sys
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
-from typing import List, Dict, Any, Optional
+import base64
+import shutil
+import tempfile
+import time
+import orjson
+import sqlite3
+import operator
+import asyncio
+import httpx
+from urllib.parse import quote
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
+# 优先使用libyaml的C实现加载器
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 # 配置文件路径常量
 CONFIG_PATH = '../configs/config.yaml'
 OUTPUT_DIR = '../data2/raw_data/repos'
+CACHE_DB_PATH = '../data2/crawl_cache.db'
+
+# 文件记录按数组输出以省去每个文件一次dict分配，字段顺序写入元数据头
+FILE_FIELDS = ['path', 'download_url', 'size']
+_file_record = operator.itemgetter(*FILE_FIELDS)
+
+# 已加载的配置：路径 -> ((mtime_ns, size), 配置)
+_config_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+
+# 输出文件写缓冲大小（字节）、写入队列容量及每批写入的记录数
+OUTPUT_BUFFER_SIZE = 1 << 20
+WRITE_QUEUE_SIZE = 10000
+WRITE_BATCH_SIZE = 256
+
+# 连接池上限及空闲连接保活时间（秒）；HTTP/2下多个请求复用同一连接
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_TIMEOUT = 75
+# 所有请求共用的默认请求头，创建客户端时一次性设置，单个请求不再重复构造
+DEFAULT_HEADERS = {
+    'User-Agent': 'ERNIE-X1.1',
+    'Accept': 'application/vnd.github.v3+json',
+    # JSON列表压缩率很高；httpx按Content-Encoding自动解压
+    'Accept-Encoding': 'gzip, deflate'
+}
+
+# GraphQL接口地址及单次查询展开的最大目录深度（避免超出查询复杂度限制）
+GRAPHQL_URL = 'https://api.github.com/graphql'
+GRAPHQL_MAX_DEPTH = 6
+
+# 同时在途的请求数上限与单个请求超时（秒，大仓库的递归树生成较慢）
+MAX_CONCURRENT_REQUESTS = 64
+REQUEST_TIMEOUT = 60
+
+# 同时爬取的仓库数量上限
+MAX_CONCURRENT_REPOS = 8
+
+# Contents API遍历时并发拉取目录的worker数量
+CRAWL_WORKERS = MAX_CONCURRENT_REQUESTS
+
+# 限流重试次数与指数退避基数（秒）
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+
+class _QuotaWindow:
+    """单个限流资源（core、graphql等）的配额窗口"""
+
+    def __init__(self):
+        # 服务端报告的当前窗口剩余配额（未知时为None）及重置时刻（monotonic时钟）
+        self.remaining: Optional[int] = None
+        self.reset_epoch = 0
+        self.reset_at = 0.0
+        # 已发出但尚未返回的请求数，可用配额为 remaining - in_flight
+        self.in_flight = 0
+        # 每个资源独立加锁，某个资源耗尽等待时不阻塞其他资源的请求
+        self.lock = asyncio.Lock()
+
+class GitHubRateLimiter:
+    """GitHub API限流器：按响应头中的剩余配额与重置时间控制请求发放
+
+    GitHub对REST（core）与GraphQL等资源分别计数，配额状态按 X-RateLimit-Resource 分开维护。
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                 max_retries: int = MAX_RETRIES, backoff_base: float = BACKOFF_BASE):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._windows: Dict[str, _QuotaWindow] = {}
+
+    def _window(self, resource: str) -> _QuotaWindow:
+        window = self._windows.get(resource)
+        if window is None:
+            window = self._windows[resource] = _QuotaWindow()
+        return window
+
+    async def acquire(self, resource: str = 'core') -> None:
+        """占用一个并发名额和该资源的一个配额，配额耗尽时等待至窗口重置"""
+        window = self._window(resource)
+        # 先在该资源的窗口上等待配额，再占用共享并发名额，
+        # 避免一个资源耗尽时等待者占满名额而阻塞其他资源
+        async with window.lock:
+            if window.remaining is not None and window.remaining - window.in_flight <= 0:
+                delay = window.reset_at - time.monotonic()
+                if delay > 0:
+                    print(f"\nRate limit ({resource}) exhausted, waiting {delay:.0f}s for reset")
+                    await asyncio.sleep(delay)
+                window.remaining = None
+            window.in_flight += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            window.in_flight -= 1
+            raise
+
+    def release(self, resource: str = 'core') -> None:
+        """请求返回后归还并发名额与在途计数，随后应以响应头调用update"""
+        self._window(resource).in_flight -= 1
+        self._semaphore.release()
+
+    def update(self, headers) -> None:
+        """根据 X-RateLimit-Resource / Remaining / Reset 同步对应资源的配额状态"""
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        window = self._window(headers.get('X-RateLimit-Resource', 'core'))
+        remaining, reset = int(remaining), int(reset)
+        # 只记录服务端的计数（304不计费，计数不变）；同一窗口内取较小值以应对响应乱序，
+        # 进入新窗口则直接采用
+        if window.remaining is None or reset != window.reset_epoch or remaining < window.remaining:
+            window.remaining = remaining
+        window.reset_epoch = reset
+        # 将服务端的epoch重置时间换算为monotonic时钟，避免本地时钟跳变
+        window.reset_at = time.monotonic() + max(0.0, reset - time.time())
+
+    def retry_delay(self, status: int, headers, attempt: int) -> Optional[float]:
+        """计算限流响应的重试等待时间，非限流错误返回None"""
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None:
+            return max(float(int(retry_after)), self.backoff_base * 2 ** attempt)
+        if headers.get('X-RateLimit-Remaining') == '0':
+            window = self._window(headers.get('X-RateLimit-Resource', 'core'))
+            return max(0.0, window.reset_at - time.monotonic())
+        if status == 429:
+            return self.backoff_base * 2 ** attempt
+        # 403 且无限流提示时视为权限错误，不重试
+        return None
+
+class CrawlFilter:
+    """爬取过滤规则：跳过指定目录名、超大文件及非目标扩展名
+
+    逐目录请求的路径（contents 后端、被截断的 trees 子树）在请求前判断目录，
+    一次返回整棵树的后端只能在写入记录时过滤。
+    """
+
+    def __init__(self, exclude_dirs: Optional[List[str]] = None,
+                 max_file_size: Optional[int] = None, extensions: Optional[List[str]] = None):
+        self.exclude_dirs = frozenset(exclude_dirs or ())
+        self.max_file_size = max_file_size
+        # 统一为小写且带前导点，空集合表示不限制扩展名
+        self.extensions = frozenset(
+            ext.lower() if ext.startswith('.') else f'.{ext.lower()}' for ext in extensions or ()
+        )
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'CrawlFilter':
+        """由配置中可选的 crawl_filters 段构建过滤规则"""
+        filters = config.get('crawl_filters') or {}
+        return cls(filters.get('exclude_dirs'), filters.get('max_file_size'), filters.get('extensions'))
+
+    def allow_dir(self, path: str) -> bool:
+        """目录名不在排除列表中时才继续遍历"""
+        return path.rsplit('/', 1)[-1] not in self.exclude_dirs
+
+    def allow_file(self, path: str, size: Optional[int]) -> bool:
+        """文件所在目录未被排除、大小与扩展名均满足要求时才输出"""
+        if self.exclude_dirs and not self.exclude_dirs.isdisjoint(path.split('/')[:-1]):
+            return False
+        if self.max_file_size is not None and size is not None and size > self.max_file_size:
+            return False
+        if self.extensions:
+            name = path.rsplit('/', 1)[-1]
+            dot = name.rfind('.')
+            return dot > 0 and name[dot:].lower() in self.extensions
+        return True
+
+# 默认不做任何过滤
+NO_FILTER = CrawlFilter()
+
+# 全局共享的 HTTP 会话与限流器（首次请求时创建）
+_session: Optional[httpx.AsyncClient] = None
+_rate_limiter: Optional[GitHubRateLimiter] = None
+
+class ResponseCache:
+    """基于SQLite的响应缓存：按URL保存ETag与原始响应体，用于条件请求"""
+
+    def __init__(self, db_path: str):
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache (url TEXT PRIMARY KEY, etag TEXT, body BLOB)'
+        )
+
+    def get(self, url: str) -> Optional[Tuple[str, bytes]]:
+        """返回缓存的 (ETag, 响应体)，未命中时返回None"""
+        return self._conn.execute('SELECT etag, body FROM cache WHERE url = ?', (url,)).fetchone()
+
+    def put(self, url: str, etag: str, body: bytes) -> None:
+        """写入或覆盖URL对应的缓存项"""
+        self._conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (url, etag, body))
+
+    def close(self) -> None:
+        """提交本次爬取的所有写入并关闭数据库"""
+        self._conn.commit()
+        self._conn.close()
+
+# 条件请求缓存（未打开时不发送条件请求）
+_response_cache: Optional[ResponseCache] = None
+
+def open_response_cache(db_path: str) -> None:
+    """启动时打开持久化的响应缓存，库损坏时从空缓存开始"""
+    global _response_cache
+    try:
+        _response_cache = ResponseCache(db_path)
+    except sqlite3.DatabaseError:
+        print(f"Warning: Ignoring corrupt response cache at {db_path}")
+        os.remove(db_path)
+        _response_cache = ResponseCache(db_path)
+
+def close_response_cache() -> None:
+    """退出时持久化并关闭响应缓存，供下次增量爬取复用"""
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+    _response_cache = None
+
+def get_session(token: str) -> httpx.AsyncClient:
+    """获取全局共享的HTTP/2客户端（带默认请求头与keep-alive连接池），不存在时按token创建"""
+    global _session
+    if _session is None or _session.is_closed:
+        _session = httpx.AsyncClient(
+            http2=True,
+            headers={**DEFAULT_HEADERS, 'Authorization': f'token {token}'},
+            # 复用TCP+TLS连接并在其上多路复用请求，避免每个请求重新握手
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_TIMEOUT
+            ),
+            timeout=REQUEST_TIMEOUT
+        )
+    return _session
+
+def get_rate_limiter() -> GitHubRateLimiter:
+    """获取全局共享的限流器，所有请求共用同一份配额状态"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = GitHubRateLimiter()
+    return _rate_limiter
+
+async def close_session() -> None:
+    """关闭全局共享的HTTP客户端并重置限流器"""
+    global _session, _rate_limiter
+    if _session is not None and not _session.is_closed:
+        await _session.aclose()
+    _session = None
+    _rate_limiter = None
+
+async def _send_with_retry(url: str, send, resource: str = 'core') -> httpx.Response:
+    """经限流器发送请求（send为返回协程的无参函数，resource为所属限流资源），遇到限流时退避重试"""
+    limiter = get_rate_limiter()
+    
+    for attempt in range(limiter.max_retries + 1):
+        delay = None
+        await limiter.acquire(resource)
+        try:
+            response = await send()
+        finally:
+            limiter.release(resource)
+        
+        limiter.update(response.headers)
+        if response.status_code in (403, 429) and attempt < limiter.max_retries:
+            delay = limiter.retry_delay(response.status_code, response.headers, attempt)
+        if delay is None:
+            return response
+        
+        print(f"\nWarning: Rate limited on {url}, retrying in {delay:.0f}s")
+        await asyncio.sleep(delay)
+
+async def github_get(url: str, token: str) -> Tuple[int, str, Any, Any]:
+    """经限流器发送GET请求，遇到限流时退避重试；返回 (状态码, 原因, 响应头, JSON数据)
+
+    带上缓存的ETag发送条件请求，304（不计入配额）时返回缓存的响应体并视为200。
+    """
+    session = get_session(token)
+    cached = _response_cache.get(url) if _response_cache is not None else None
+    headers = {'If-None-Match': cached[0]} if cached else None
+    
+    response = await _send_with_retry(url, lambda: session.get(url, headers=headers))
+    status = response.status_code
+    if status == 304 and cached:
+        return 200, response.reason_phrase, response.headers, orjson.loads(cached[1])
+    data = None
+    if status == 200:
+        # 直接解析响应字节，省去解码为str再解析的开销
+        data = orjson.loads(response.content)
+        etag = response.headers.get('ETag')
+        if etag and _response_cache is not None:
+            _response_cache.put(url, etag, response.content)
+    return status, response.reason_phrase, response.headers, data
+
+async def github_graphql(query: str, variables: Dict[str, Any], token: str) -> Dict[str, Any]:
+    """经限流器发送GraphQL查询并返回data字段，HTTP或GraphQL错误时抛出异常"""
+    session = get_session(token)
+    payload = orjson.dumps({'query': query, 'variables': variables})
+    response = await _send_with_retry(GRAPHQL_URL, lambda: session.post(
+        GRAPHQL_URL, content=payload, headers={'Content-Type': 'application/json'}
+    ), resource='graphql')
+    if response.status_code != 200:
+        raise Exception(f"GitHub API error ({response.status_code}): {response.reason_phrase}")
+    result = orjson.loads(response.content)
+    if result.get('errors'):
+        raise Exception(f"GitHub GraphQL error: {result['errors'][0].get('message')}")
+    return result['data']
 
 def load_config(config_path: str) -> Dict[str, Any]:
-    """加载配置文件并验证结构"""
+    """加载配置文件并验证结构，文件未变化时直接返回缓存结果"""
     try:
+        stat = os.stat(config_path)
+        cache_key = (stat.st_mtime_ns, stat.st_size)
+        cached = _config_cache.get(config_path)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+        
         with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
-            
+            config = yaml.load(f, Loader=SafeLoader)
+        
         # 验证必要配置项
-        required = {'github': {'token'}, 'crawl_repos':{}}
-        for req_key, req_subkeys in required.items():
-            if req_key not in config:
-                raise ValueError(f"Missing '{req_key}' section in config")
-            if isinstance(config[req_key], dict):
-                for subkey in req_subkeys:
-                    if subkey not in config[req_key]:
-                        raise ValueError(f"Missing '{req_key}.{subkey}' in config")
+        if not isinstance(config, dict):
+            raise ValueError("Invalid YAML format: top level must be a mapping")
+        if 'github' not in config:
+            raise ValueError("Missing 'github' section in config")
+        if not isinstance(config['github'], dict) or 'token' not in config['github']:
+            raise ValueError("Missing 'github.token' in config")
+        if 'crawl_repos' not in config:
+            raise ValueError("Missing 'crawl_repos' section in config")
+        if config.get('crawl_backend', DEFAULT_BACKEND) not in CRAWL_BACKENDS:
+            raise ValueError(
+                f"Unknown crawl_backend '{config['crawl_backend']}', "
+                f"expected one of: {', '.join(CRAWL_BACKENDS)}"
+            )
         
+        _config_cache[config_path] = (cache_key, config)
         return config
     except FileNotFoundError:
         raise FileNotFoundError(
@@ -41,96 +373,370 @@ def load_config(config_path: str) -> Dict[str, Any]:
     except yaml.YAMLError as e:
         raise ValueError(f"Invalid YAML format: {e}")
 
-def get_github_repo(repo_url: str, token: str) -> Dict[str, Any]:
+async def get_github_repo(repo_url: str, token: str) -> Dict[str, Any]:
     """获取GitHub仓库基本信息"""
-    request = Request(repo_url)
-    request.add_header('Authorization', f'token {token}')
-    request.add_header('User-Agent', 'ERNIE-X1.1')
-    request.add_header('Accept', 'application/vnd.github.v3+json')
-    
     try:
-        with urlopen(request) as response:
-            if response.status != 200:
-                raise HTTPError(response.url, response.status, "GitHub API error", None, None)
-            return json.loads(response.read().decode())
-    except HTTPError as e:
-        raise Exception(f"GitHub API error ({e.code}): {e.reason}")
-    except URLError as e:
-        raise Exception(f"Network error: {e.reason}")
-
-def get_repo_files(repo_owner: str, repo_name: str, token: str, path: str, output_file)-> None :
-    """递归获取仓库所有文件列表（含分页处理）"""
-    url = f'https://api.github.com/repos/{repo_owner}/{repo_name}/contents/{path}'
-    files = []
+        status, reason, _, data = await github_get(repo_url, token)
+        if status != 200:
+            raise Exception(f"GitHub API error ({status}): {reason}")
+        return data
+    except httpx.RequestError as e:
+        raise Exception(f"Network error: {e}")
+
+# RFC 8288 Link头：<URI-Reference> 后跟若干 ;param[=token|"quoted"]
+_LINK_VALUE_RE = re.compile(
+    r'<([^>]*)>((?:\s*;\s*[^\s;,=]+(?:\s*=\s*(?:"(?:[^"\\]|\\.)*"|[^\s;,]*))?)*)'
+)
+_LINK_PARAM_RE = re.compile(
+    r';\s*([^\s;,=]+)(?:\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^\s;,]*)))?'
+)
+
+def parse_link_header(link_header: str) -> Dict[str, str]:
+    """按RFC 8288解析Link响应头，返回 rel -> url 映射（支持一个链接多个rel）"""
+    links = {}
+    for match in _LINK_VALUE_RE.finditer(link_header):
+        url, params = match.groups()
+        for param in _LINK_PARAM_RE.finditer(params):
+            name, quoted, token = param.groups()
+            if name.lower() != 'rel':
+                continue
+            value = re.sub(r'\\(.)', r'\1', quoted) if quoted is not None else (token or '')
+            for rel in value.lower().split():
+                links.setdefault(rel, url)
+            # 同一链接只取第一个rel参数
+            break
+    return links
+
+def write_metadata_header(output_file, repo_info: Dict) -> None:
+    """写入JSONL输出的首行：仓库元数据、爬取时间及文件记录的字段顺序"""
+    output_file.write(orjson.dumps({
+        'repo_info': repo_info,
+        'crawl_timestamp': datetime.now().isoformat(),
+        'file_fields': FILE_FIELDS
+    }) + b'\n')
+
+def write_file_record(output_file, record: Tuple[str, str, int]) -> None:
+    """向输出文件（二进制模式）追加一行文件记录 [path, download_url, size]"""
+    output_file.write(orjson.dumps(record) + b'\n')
+
+class RecordWriter:
+    """单一写入任务：worker将记录放入队列，由写入任务批量序列化后writelines落盘"""
+
+    _STOP = object()
+
+    def __init__(self, output_file, batch_size: int = WRITE_BATCH_SIZE,
+                 maxsize: int = WRITE_QUEUE_SIZE):
+        self.output_file = output_file
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> 'RecordWriter':
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        # 无论是否异常都写出剩余记录，再等待写入任务结束
+        if not self._task.done():
+            await self._queue.put(self._STOP)
+        await self._task
+
+    async def put(self, record: Tuple[str, str, int]) -> None:
+        """放入一条文件记录，队列满时等待写入任务消费（背压）"""
+        if self._task.done():
+            # 写入任务已异常退出，立即抛出而不是阻塞在满队列上
+            self._task.result()
+        await self._queue.put(record)
+
+    async def _run(self) -> None:
+        batch = []
+        while True:
+            record = await self._queue.get()
+            if record is self._STOP:
+                break
+            batch.append(orjson.dumps(record) + b'\n')
+            if len(batch) >= self.batch_size:
+                self.output_file.writelines(batch)
+                batch = []
+        if batch:
+            self.output_file.writelines(batch)
+
+async def get_repo_files(repo_owner: str, repo_name: str, token: str, path: str, output_file,
+                         workers: int = CRAWL_WORKERS, crawl_filter: CrawlFilter = NO_FILTER) -> None:
+    """基于任务队列遍历仓库所有文件（含分页处理），由固定数量的worker并发拉取目录"""
+    # owner/name只插值一次，队列中的目录以路径分段元组表示，请求时再拼接
+    contents_url = f'https://api.github.com/repos/{repo_owner}/{repo_name}/contents/%s'
+    queue: asyncio.Queue = asyncio.Queue()
+    errors: List[Exception] = []
+    queue.put_nowait(tuple(path.split('/')) if path else ())
+    
+    async def worker() -> None:
+        while True:
+            segments = await queue.get()
+            try:
+                await _list_directory(contents_url, repo_name, token, segments, writer,
+                                      queue, crawl_filter)
+            except Exception as e:
+                # 记录异常但保持worker存活，否则剩余任务无人消费导致join挂起
+                errors.append(e)
+            finally:
+                queue.task_done()
+    
+    async with RecordWriter(output_file) as writer:
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    if errors:
+        raise errors[0]
+
+async def _list_directory(contents_url: str, repo_name: str, token: str, segments: Tuple[str, ...],
+                          writer: RecordWriter, queue: asyncio.Queue, crawl_filter: CrawlFilter) -> None:
+    """拉取单个目录的所有分页，写入文件信息并将子目录（分段元组）放入任务队列"""
+    # 逐段转义，目录名中的 #、?、% 等字符不会改变请求的URL结构
+    url = contents_url % '/'.join(map(quote, segments))
     
     while url:
-        request = Request(url)
-        request.add_header('Authorization', f'token {token}')
-        request.add_header('User-Agent', 'ERNIE-X1.1')
-        request.add_header('Accept', 'application/vnd.github.v3+json')
-        
         try:
-            with urlopen(request) as response:
-                if response.status != 200:
-                    break
-                data = json.loads(response.read().decode())
-                print("get repo data: ", data[0])
-                for item in data:
-                    if item['type'] == 'file':
-                        # 立即写入当前文件信息
-                        json_line = json.dumps({
-                            'path': item['path'],
-                            'download_url': item['download_url'],
-                            'size': item['size']
-                        }, ensure_ascii=False)
-                        output_file.write(json_line + '\n')
-                        
-                        # files.append({
-                        #     'path': item['path'],
-                        #     'download_url': item['download_url'],
-                        #     'size': item['size']
-                        # })
-                    elif item['type'] == 'dir':
-                        # 递归处理子目录（传递已打开的文件句柄）
-                        get_repo_files(repo_owner, repo_name, token, item['path'], output_file)
-                
-                        # subdir_files = get_repo_files(repo_owner, repo_name, token, item['path'])
-                        # files.extend(subdir_files)
-                
-                # 处理分页
-                link_header = response.headers.get('Link', '')
-                url = None
-                if link_header:
-                    next_link = [link.strip() for link in link_header.split(',') 
-                                if 'rel="next"' in link]
-                    if next_link:
-                        url = next_link[0].split(';')[0].strip('<>')
-                        
-        except HTTPError as e:
-            print(f"\nWarning: Skipping {repo_name}/{path} due to HTTP {e.code}")
-            break
-        except URLError as e:
-            print(f"\nWarning: Skipping {repo_name}/{path} due to network error")
+            status, _, headers, data = await github_get(url, token)
+            if status != 200:
+                print(f"\nWarning: Skipping {repo_name}/{'/'.join(segments)} due to HTTP {status}")
+                break
+            for item in data:
+                if item['type'] == 'file':
+                    # 立即写入当前文件信息
+                    if crawl_filter.allow_file(item['path'], item['size']):
+                        await writer.put(_file_record(item))
+                elif item['type'] == 'dir':
+                    # 子目录交给空闲worker立即处理，被排除的目录不再发起请求
+                    if crawl_filter.allow_dir(item['path']):
+                        queue.put_nowait(segments + (item['name'],))
+            
+            # 处理分页
+            url = parse_link_header(headers.get('Link', '')).get('next')
+                    
+        except httpx.RequestError:
+            print(f"\nWarning: Skipping {repo_name}/{'/'.join(segments)} due to network error")
             break
+
+async def get_repo_tree(repo_owner: str, repo_name: str, token: str, output_file,
+                        branch: Optional[str] = None, crawl_filter: CrawlFilter = NO_FILTER) -> None:
+    """通过Git Trees API一次性获取默认分支的完整文件树并写入文件列表"""
+    repo_url = f'https://api.github.com/repos/{repo_owner}/{repo_name}'
+    if branch is None:
+        branch = (await get_github_repo(repo_url, token))['default_branch']
     
-    return files
+    # 解析分支对应的提交sha，Trees API接受提交sha作为tree-ish
+    status, reason, _, ref = await github_get(f'{repo_url}/git/refs/heads/{quote(branch)}', token)
+    if status != 200:
+        raise Exception(f"GitHub API error ({status}): {reason}")
+    
+    raw_root = f'https://raw.githubusercontent.com/{repo_owner}/{repo_name}/{quote(branch)}'
+    async with RecordWriter(output_file) as writer:
+        await _get_subtree(repo_url, raw_root, token, ref['object']['sha'], '', writer, crawl_filter)
+
+async def _get_subtree(repo_url: str, raw_root: str, token: str, sha: str, prefix: str,
+                       writer: RecordWriter, crawl_filter: CrawlFilter) -> None:
+    """递归拉取子树：先尝试recursive=1，结果被截断时逐层并发拉取子树"""
+    status, _, _, data = await github_get(f'{repo_url}/git/trees/{sha}?recursive=1', token)
+    if status == 200 and data.get('truncated'):
+        # 超出单次响应上限，改为只取当前层，子目录再各自尝试递归拉取
+        status, _, _, data = await github_get(f'{repo_url}/git/trees/{sha}', token)
+        subtrees = [
+            item for item in data['tree']
+            if item['type'] == 'tree' and crawl_filter.allow_dir(item['path'])
+        ] if status == 200 else []
+    else:
+        subtrees = []
+    if status != 200:
+        print(f"\nWarning: Skipping {repo_url}/{prefix} due to HTTP {status}")
+        return
+    
+    for item in data['tree']:
+        if item['type'] == 'blob':
+            path = prefix + item['path']
+            if crawl_filter.allow_file(path, item['size']):
+                await writer.put((path, f'{raw_root}/{quote(path)}', item['size']))
+    
+    if subtrees:
+        await asyncio.gather(*[
+            _get_subtree(repo_url, raw_root, token, item['sha'], f"{prefix}{item['path']}/",
+                         writer, crawl_filter)
+            for item in subtrees
+        ])
+
+async def get_repo_tree_git(repo_owner: str, repo_name: str, token: str, output_file,
+                            branch: Optional[str] = None, crawl_filter: CrawlFilter = NO_FILTER) -> None:
+    """通过git浅层部分克隆枚举文件，绕开REST API配额
+
+    只拉取最新提交的tree对象（--filter=blob:none），因此记录中的size为None。
+    """
+    clone_dir = tempfile.mkdtemp(prefix=f'{repo_owner}_{repo_name}_')
+    # 通过环境变量注入认证头，避免token出现在命令行参数或克隆目录的配置中
+    credentials = base64.b64encode(f'x-access-token:{token}'.encode()).decode()
+    env = dict(os.environ,
+               GIT_TERMINAL_PROMPT='0',
+               GIT_CONFIG_COUNT='1',
+               GIT_CONFIG_KEY_0='http.extraHeader',
+               GIT_CONFIG_VALUE_0=f'Authorization: Basic {credentials}')
+    try:
+        clone_args = ['clone', '--bare', '--depth', '1', '--filter=blob:none', '--single-branch']
+        if branch is not None:
+            clone_args += ['--branch', branch]
+        await _run_git(*clone_args, f'https://github.com/{repo_owner}/{repo_name}.git', clone_dir, env=env)
+        listing = await _run_git('-C', clone_dir, 'ls-tree', '-r', '-z', '--full-tree', 'HEAD', env=env)
+    finally:
+        shutil.rmtree(clone_dir, ignore_errors=True)
+    
+    raw_root = f"https://raw.githubusercontent.com/{repo_owner}/{repo_name}/{quote(branch or 'HEAD')}"
+    async with RecordWriter(output_file) as writer:
+        # 每项格式：<mode> SP <type> SP <object> TAB <path> NUL
+        for entry in listing.split(b'\0'):
+            if not entry:
+                continue
+            meta, path = entry.split(b'\t', 1)
+            if meta.split(b' ', 2)[1] != b'blob':
+                continue
+            path = path.decode('utf-8', 'surrogateescape')
+            if crawl_filter.allow_file(path, None):
+                await writer.put((path, f'{raw_root}/{quote(path)}', None))
+
+async def _run_git(*args: str, env: Dict[str, str]) -> bytes:
+    """执行git子命令并返回标准输出，失败时抛出异常"""
+    process = await asyncio.create_subprocess_exec(
+        'git', *args, env=env,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise Exception(f"git command failed ({process.returncode}): "
+                        f"{stderr.decode(errors='replace').strip()}")
+    return stdout
+
+def _build_tree_query(depth: int) -> str:
+    """构造嵌套depth层的树查询；最深一层只取子树oid，留给Trees API补全"""
+    selection = '... on Tree { oid }'
+    for _ in range(depth):
+        selection = (
+            '... on Tree { oid entries { path type object { '
+            f'... on Blob {{ byteSize }} {selection} }} }} }}'
+        )
+    return (
+        'query($owner: String!, $name: String!, $expression: String!) { '
+        f'repository(owner: $owner, name: $name) {{ object(expression: $expression) {{ {selection} }} }} }}'
+    )
+
+_TREE_QUERY = _build_tree_query(GRAPHQL_MAX_DEPTH)
+
+async def get_repo_tree_graphql(repo_owner: str, repo_name: str, token: str, output_file,
+                                branch: Optional[str] = None, crawl_filter: CrawlFilter = NO_FILTER) -> None:
+    """通过一次GraphQL查询获取前GRAPHQL_MAX_DEPTH层文件树，更深的子树退回Trees API
+
+    查询未分页，宽仓库可能触发GraphQL超时或资源限制；查询失败时整仓库改用Trees API。
+    """
+    try:
+        data = await github_graphql(_TREE_QUERY, {
+            'owner': repo_owner,
+            'name': repo_name,
+            'expression': f"{branch or 'HEAD'}:"
+        }, token)
+    except Exception as e:
+        print(f"\nWarning: GraphQL tree query failed for {repo_owner}/{repo_name} ({e}), "
+              "falling back to Trees API")
+        await get_repo_tree(repo_owner, repo_name, token, output_file,
+                            branch=branch, crawl_filter=crawl_filter)
+        return
+    root = (data.get('repository') or {}).get('object')
+    if root is None:
+        raise Exception(f"GitHub GraphQL error: no tree for {repo_owner}/{repo_name}@{branch or 'HEAD'}")
+    
+    repo_url = f'https://api.github.com/repos/{repo_owner}/{repo_name}'
+    raw_root = f"https://raw.githubusercontent.com/{repo_owner}/{repo_name}/{quote(branch or 'HEAD')}"
+    async with RecordWriter(output_file) as writer:
+        # 超出查询深度的子树：(路径前缀, tree oid)
+        deep_trees: List[Tuple[str, str]] = []
+        await _write_graphql_tree(root, raw_root, writer, crawl_filter, deep_trees)
+        if deep_trees:
+            await asyncio.gather(*[
+                _get_subtree(repo_url, raw_root, token, oid, prefix, writer, crawl_filter)
+                for prefix, oid in deep_trees
+            ])
+
+async def _write_graphql_tree(tree: Dict[str, Any], raw_root: str, writer: RecordWriter,
+                              crawl_filter: CrawlFilter, deep_trees: List[Tuple[str, str]]) -> None:
+    """遍历GraphQL返回的嵌套树，写入文件记录并收集未展开的子树"""
+    stack = [tree]
+    while stack:
+        for entry in stack.pop()['entries']:
+            path, obj = entry['path'], entry['object']
+            if entry['type'] == 'blob':
+                if crawl_filter.allow_file(path, obj['byteSize']):
+                    await writer.put((path, f'{raw_root}/{quote(path)}', obj['byteSize']))
+            elif entry['type'] == 'tree' and crawl_filter.allow_dir(path):
+                if 'entries' in obj:
+                    stack.append(obj)
+                else:
+                    deep_trees.append((f'{path}/', obj['oid']))
+
+async def get_repo_contents(repo_owner: str, repo_name: str, token: str, output_file,
+                            branch: Optional[str] = None, crawl_filter: CrawlFilter = NO_FILTER) -> None:
+    """通过Contents API从根目录逐目录遍历（默认分支），被排除的目录不发起请求"""
+    await get_repo_files(repo_owner, repo_name, token, '', output_file, crawl_filter=crawl_filter)
+
+# 文件列表获取方式：trees 使用Git Trees API，contents 使用Contents API逐目录遍历，
+# git 使用浅层部分克隆，graphql 使用GraphQL单次查询
+CRAWL_BACKENDS = {
+    'trees': get_repo_tree,
+    'contents': get_repo_contents,
+    'git': get_repo_tree_git,
+    'graphql': get_repo_tree_graphql
+}
+DEFAULT_BACKEND = 'trees'
 
 def save_crawl_result(owner: str, repo_name: str, repo_info: Dict, files: List) -> None:
-    """保存爬取结果到JSON文件"""
+    """保存爬取结果到JSONL文件：首行为仓库元数据，其后每行一条文件记录"""
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     output_path = os.path.join(OUTPUT_DIR, f'{owner}_{repo_name}.json')
     
-    result = {
-        'repo_info': repo_info,
-        'files': files,
-        'crawl_timestamp': datetime.now().isoformat()
-    }
-    
-    with open(output_path, 'w') as f:
-        json.dump(result, f, indent=2)
+    with open(output_path, 'wb', buffering=OUTPUT_BUFFER_SIZE) as f:
+        write_metadata_header(f, repo_info)
+        for file in files:
+            write_file_record(f, _file_record(file))
     print(f"Saved {len(files)} files for {repo_name}")
 
-def main():
+async def crawl_one(repo: str, token: str, sem: asyncio.Semaphore,
+                    crawl_filter: CrawlFilter = NO_FILTER, backend: str = DEFAULT_BACKEND) -> None:
+    """爬取单个仓库（受信号量限制并发）：写入元数据头并追加文件列表"""
+    async with sem:
+        await _crawl_repo(repo, token, crawl_filter, CRAWL_BACKENDS[backend])
+
+async def _crawl_repo(repo: str, token: str, crawl_filter: CrawlFilter, list_files) -> None:
+    """爬取单个仓库：写入元数据头并追加文件列表，每个仓库独立输出文件"""
+    try:
+        owner, repo_name = repo.split('/')
+        repo_url = f'https://api.github.com/repos/{owner}/{repo_name}'
+        print(f"Processing {owner}/{repo_name}...")
+        
+        # 获取仓库基本信息
+        repo_info = await get_github_repo(repo_url, token)
+        print(f"  Fetched repo info: {repo_info['html_url']}")
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(OUTPUT_DIR, f'{owner}_{repo_name}.json')
+        with open(output_path, 'wb', buffering=OUTPUT_BUFFER_SIZE) as f:
+            # 写入仓库元数据头
+            write_metadata_header(f, repo_info)
+            # 按配置的方式获取并追加文件数据
+            await list_files(owner, repo_name, token, f, branch=repo_info['default_branch'],
+                             crawl_filter=crawl_filter)
+        
+    except Exception as e:
+        print(f"  Error processing {repo}: {str(e)}")
+
+async def amain():
     print("Starting GitHub repository crawler...\n")
     print(f"Using config: {CONFIG_PATH}\n")
     
@@ -139,46 +745,22 @@ def main():
         config = load_config(CONFIG_PATH)
         token = config['github']['token']
         repos = config['crawl_repos']
+        crawl_filter = CrawlFilter.from_config(config)
+        backend = config.get('crawl_backend', DEFAULT_BACKEND)
         
         print(f"Config loaded. Token ends with: {token[-4:]}")
         print(f"Target repositories: {', '.join(repos)}\n")
         
-        # 遍历所有仓库
-        for i, repo in enumerate(repos, 1):
-            owner, repo_name = repo.split('/')
-            repo_url = f'https://api.github.com/repos/{owner}/{repo_name}'
-            
-            try:
-                print(f"Processing [{i}/{len(repos)}] {repo_name}...")
-                
-                # 获取仓库基本信息
-                repo_info = get_github_repo(repo_url, token)
-                print(f"  Fetched repo info: {repo_info['html_url']}")
-                """保存爬取结果到JSON文件"""
-                os.makedirs(OUTPUT_DIR, exist_ok=True)
-                output_path = os.path.join(OUTPUT_DIR, f'{owner}_{repo_name}.json')
-                # 写入仓库元数据头
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    metadata = {
-                        'repo_info': repo_info,
-                        'crawl_timestamp': datetime.now().isoformat()
-                    }
-                    f.write(json.dumps(metadata, ensure_ascii=False) + '\n')
-                
-                # 递归获取并追加文件数据
-                with open(output_path, 'a', encoding='utf-8') as f:  # 追加模式
-                    get_repo_files(owner, repo_name, token, '', f)
-    
-                # # 获取文件列表
-                # files = get_repo_files(owner, repo_name, token)
-                # print(f"  Found {len(files)} files")
-                
-                # # 保存结果
-                # save_crawl_result(owner, repo_name, repo_info, files)
-                
-            except Exception as e:
-                print(f"  Error processing {repo_name}: {str(e)}")
-                continue
+        # 并发爬取所有仓库，同时进行的仓库数受信号量限制
+        open_response_cache(CACHE_DB_PATH)
+        sem = asyncio.Semaphore(MAX_CONCURRENT_REPOS)
+        try:
+            await asyncio.gather(*[
+                crawl_one(repo, token, sem, crawl_filter, backend) for repo in repos
+            ], return_exceptions=True)
+        finally:
+            await close_session()
+            close_response_cache()
         
         print("\nCrawler completed successfully!")
         
@@ -186,5 +768,8 @@ def main():
         print(f"\nCritical error: {str(e)}")
         sys.exit(1)
 
+def main():
+    asyncio.run(amain())
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
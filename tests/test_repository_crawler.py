@@ -1,30 +1,41 @@
 # test_repository_crawler.py  
 # # 测试代码仓库爬取功能的脚本
 import unittest
-from unittest.mock import patch, MagicMock, mock_open
+from unittest.mock import patch, MagicMock, AsyncMock, mock_open
 import os
+import io
 import json
+import time
 import yaml
-from requests.exceptions import HTTPError
+import asyncio
 import sys
 sys.path.append('../code')
 
 from repository_crawler import (
+    CrawlFilter,
+    GitHubRateLimiter,
+    RecordWriter,
+    ResponseCache,
     load_config,
+    parse_link_header,
     get_github_repo,
+    github_get,
     get_repo_files,
+    get_repo_tree,
+    get_repo_tree_git,
+    get_repo_tree_graphql,
     save_crawl_result,
     main
 )
 
 class TestRepositoryCrawler(unittest.TestCase):
-    VALID_CONFIG = """
-                github:
-                token: token
-                crawl_repos:
-                - baidu/ERNIE-X1
-                - tensorflow/tensorflow
-                """
+    VALID_CONFIG = (
+        "github:\n"
+        "  token: ghp_test_token\n"
+        "crawl_repos:\n"
+        "  - baidu/ERNIE-X1\n"
+        "  - tensorflow/tensorflow\n"
+    )
     INVALID_CONFIG = "invalid_yaml"
     CONFIG_PATH = "test_config.yaml"
     OUTPUT_DIR = "test_output"
@@ -55,6 +66,13 @@ class TestRepositoryCrawler(unittest.TestCase):
             load_config(self.CONFIG_PATH)
         self.assertIn("Missing 'github' section", str(context.exception))
 
+    def test_load_config_cached_until_modified(self):
+        first = load_config(self.CONFIG_PATH)
+        self.assertIs(load_config(self.CONFIG_PATH), first)
+        with open(self.CONFIG_PATH, 'w') as f:
+            f.write(self.VALID_CONFIG + "  - test/repo\n")
+        self.assertEqual(load_config(self.CONFIG_PATH)['crawl_repos'][-1], "test/repo")
+
     def test_load_config_invalid_yaml(self):
         with open(self.CONFIG_PATH, 'w') as f:
             f.write(self.INVALID_CONFIG)
@@ -62,70 +80,406 @@ class TestRepositoryCrawler(unittest.TestCase):
             load_config(self.CONFIG_PATH)
         self.assertIn("Invalid YAML format", str(context.exception))
 
-    # 测试GitHub API请求模块
-    @patch('urllib.request.urlopen')
-    def test_get_github_repo_success(self, mock_urlopen):
+    def _mock_session(self):
+        """构造模拟的httpx.AsyncClient，get为协程"""
+        mock_session = MagicMock()
+        mock_session.get = AsyncMock()
+        return mock_session
+
+    def _mock_response(self, status=200, data=None, headers=None):
+        """构造模拟的httpx响应"""
         mock_response = MagicMock()
-        mock_response.status = 200
-        mock_response.getheader.return_value = "application/json"
-        mock_response.read.return_value = b'{"name": "test_repo"}'
-        mock_urlopen.return_value = mock_response
+        mock_response.status_code = status
+        mock_response.reason_phrase = "Unauthorized" if status == 401 else "OK"
+        mock_response.content = json.dumps(data).encode()
+        mock_response.headers = headers or {'Link': ''}
+        return mock_response
 
-        result = get_github_repo(
+    # 测试GitHub API请求模块
+    @patch('repository_crawler.get_session')
+    def test_get_github_repo_success(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.get.return_value = self._mock_response(data={"name": "test_repo"})
+        mock_get_session.return_value = mock_session
+
+        result = asyncio.run(get_github_repo(
             "https://api.github.com/repos/test/repo",
             "test_token"
-        )
+        ))
         self.assertEqual(result, {"name": "test_repo"})
 
-    @patch('urllib.request.urlopen')
-    def test_get_github_repo_http_error(self, mock_urlopen):
-        mock_response = MagicMock()
-        mock_response.status = 401
-        mock_urlopen.side_effect = HTTPError(
-            "url", 401, "Unauthorized", None, None
-        )
+    @patch('repository_crawler.get_session')
+    def test_get_github_repo_http_error(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.get.return_value = self._mock_response(status=401)
+        mock_get_session.return_value = mock_session
         with self.assertRaises(Exception) as context:
-            get_github_repo("https://api.github.com/repos/test/repo", "invalid_token")
+            asyncio.run(get_github_repo("https://api.github.com/repos/test/repo", "invalid_token"))
         self.assertIn("GitHub API error (401): Unauthorized", str(context.exception))
 
+    @patch('repository_crawler.asyncio.sleep', new_callable=AsyncMock)
+    @patch('repository_crawler.get_session')
+    def test_get_github_repo_retry_after(self, mock_get_session, mock_sleep):
+        mock_session = self._mock_session()
+        mock_session.get.side_effect = [
+            self._mock_response(status=429, headers={'Retry-After': '3'}),
+            self._mock_response(data={"name": "test_repo"})
+        ]
+        mock_get_session.return_value = mock_session
+
+        result = asyncio.run(get_github_repo("https://api.github.com/repos/test/repo", "token"))
+        self.assertEqual(result, {"name": "test_repo"})
+        self.assertEqual(mock_session.get.call_count, 2)
+        mock_sleep.assert_awaited_once_with(3.0)
+
+    @patch('repository_crawler.get_session')
+    def test_get_github_repo_not_modified(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.get.side_effect = [
+            self._mock_response(data={"name": "test_repo"}, headers={'ETag': '"abc"'}),
+            self._mock_response(status=304)
+        ]
+        mock_get_session.return_value = mock_session
+        url = "https://api.github.com/repos/test/etag"
+
+        with patch('repository_crawler._response_cache', ResponseCache(':memory:')):
+            first = asyncio.run(get_github_repo(url, "token"))
+            second = asyncio.run(get_github_repo(url, "token"))
+        self.assertEqual(first, second)
+        self.assertIsNone(mock_session.get.call_args_list[0][1]['headers'])
+        self.assertEqual(mock_session.get.call_args_list[1][1]['headers'], {'If-None-Match': '"abc"'})
+
+    @patch('repository_crawler.asyncio.sleep', new_callable=AsyncMock)
+    @patch('repository_crawler.get_session')
+    def test_not_modified_does_not_drain_quota(self, mock_get_session, mock_sleep):
+        # 服务端对每个304都报告相同的剩余配额，本地不应把配额耗尽后进入等待
+        reset = str(int(time.time()) + 3000)
+        rate_headers = {'X-RateLimit-Resource': 'core', 'X-RateLimit-Remaining': '10',
+                        'X-RateLimit-Reset': reset}
+        mock_session = self._mock_session()
+        mock_session.get.side_effect = lambda *args, **kwargs: self._mock_response(
+            status=304, headers=rate_headers)
+        mock_get_session.return_value = mock_session
+        cache = ResponseCache(':memory:')
+        url = "https://api.github.com/repos/test/repo/contents/src"
+        cache.put(url, '"abc"', b'[]')
+
+        async def recrawl():
+            for _ in range(50):
+                status, _, _, data = await github_get(url, "token")
+                self.assertEqual((status, data), (200, []))
+
+        with patch('repository_crawler._response_cache', cache), \
+             patch('repository_crawler._rate_limiter', GitHubRateLimiter()):
+            asyncio.run(recrawl())
+        self.assertEqual(mock_session.get.call_count, 50)
+        mock_sleep.assert_not_awaited()
+
+    # 测试限流器模块
+    def test_rate_limiter_waits_for_reset(self):
+        limiter = GitHubRateLimiter()
+        reset = int(time.time()) + 60
+        limiter.update({'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset': str(reset)})
+
+        async def acquire_twice(mock_sleep):
+            # 第一个请求仍在途时已占满剩余配额，第二个请求需等待窗口重置
+            await limiter.acquire()
+            mock_sleep.assert_not_awaited()
+            await limiter.acquire()
+            limiter.release()
+            limiter.release()
+
+        with patch('repository_crawler.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            asyncio.run(acquire_twice(mock_sleep))
+            mock_sleep.assert_awaited_once()
+            self.assertGreater(mock_sleep.await_args[0][0], 50)
+
+    def test_rate_limiter_buckets_by_resource(self):
+        limiter = GitHubRateLimiter()
+        reset = int(time.time()) + 60
+        limiter.update({'X-RateLimit-Resource': 'core', 'X-RateLimit-Remaining': '1',
+                        'X-RateLimit-Reset': str(reset)})
+        # GraphQL配额耗尽且重置时间不同，不应影响REST（core）的配额状态
+        limiter.update({'X-RateLimit-Resource': 'graphql', 'X-RateLimit-Remaining': '0',
+                        'X-RateLimit-Reset': str(reset + 600)})
+
+        async def acquire_core(mock_sleep):
+            await limiter.acquire('core')
+            mock_sleep.assert_not_awaited()
+            await limiter.acquire('core')
+            limiter.release('core')
+            limiter.release('core')
+
+        with patch('repository_crawler.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            asyncio.run(acquire_core(mock_sleep))
+            # core 第二次请求按 core 自己的重置时间等待，而不是graphql的
+            mock_sleep.assert_awaited_once()
+            self.assertLess(mock_sleep.await_args[0][0], 61)
+
+    def test_rate_limiter_exhausted_bucket_does_not_block_others(self):
+        limiter = GitHubRateLimiter(max_concurrency=4)
+        limiter.update({'X-RateLimit-Resource': 'core', 'X-RateLimit-Remaining': '0',
+                        'X-RateLimit-Reset': str(int(time.time()) + 60)})
+
+        async def acquire_graphql_while_core_waits():
+            # 等待core重置的请求多于并发名额，也不能占住名额阻塞graphql
+            waiters = [asyncio.create_task(limiter.acquire('core')) for _ in range(8)]
+            await asyncio.sleep(0)
+            try:
+                await asyncio.wait_for(limiter.acquire('graphql'), timeout=1)
+                limiter.release('graphql')
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+                await asyncio.gather(*waiters, return_exceptions=True)
+
+        asyncio.run(acquire_graphql_while_core_waits())
+
+    def test_rate_limiter_no_retry_on_forbidden(self):
+        limiter = GitHubRateLimiter()
+        self.assertIsNone(limiter.retry_delay(403, {'X-RateLimit-Remaining': '42'}, 0))
+        self.assertEqual(limiter.retry_delay(429, {}, 2), limiter.backoff_base * 4)
+
+    # 测试爬取过滤规则
+    def test_crawl_filter(self):
+        crawl_filter = CrawlFilter.from_config({'crawl_filters': {
+            'exclude_dirs': ['node_modules'],
+            'max_file_size': 100,
+            'extensions': ['py', '.MD']
+        }})
+        self.assertFalse(crawl_filter.allow_dir("web/node_modules"))
+        self.assertTrue(crawl_filter.allow_dir("src"))
+        self.assertTrue(crawl_filter.allow_file("src/main.py", 10))
+        self.assertTrue(crawl_filter.allow_file("README.md", 10))
+        self.assertFalse(crawl_filter.allow_file("src/main.py", 1000))
+        self.assertFalse(crawl_filter.allow_file("setup.cfg", 10))
+        self.assertFalse(crawl_filter.allow_file("node_modules/a/index.py", 10))
+        self.assertTrue(CrawlFilter.from_config({}).allow_file("any/file.bin", 10 ** 9))
+
+    # 测试分页Link头解析
+    def test_parse_link_header(self):
+        header = (
+            '<https://api.github.com/x?page=2&filter=a,b>; rel="next", '
+            '<https://api.github.com/x?page=9>; title="last, page"; rel="last end"'
+        )
+        links = parse_link_header(header)
+        self.assertEqual(links['next'], "https://api.github.com/x?page=2&filter=a,b")
+        self.assertEqual(links['last'], "https://api.github.com/x?page=9")
+        self.assertEqual(links['end'], "https://api.github.com/x?page=9")
+        self.assertEqual(parse_link_header(''), {})
+
     # 测试文件列表获取模块
-    @patch('urllib.request.urlopen')
-    def test_get_repo_files_single_file(self, mock_urlopen):
-        mock_response = MagicMock()
-        mock_response.status = 200
-        mock_response.read.return_value = b'''[
-            {"type": "file", "path": "README.md", "download_url": "https://..."}
-        ]'''
-        mock_response.headers = {'Link': ''}
-        mock_urlopen.return_value = mock_response
-
-        files = get_repo_files("test", "repo", "token")
-        self.assertEqual(len(files), 1)
-        self.assertEqual(files[0]['path'], "README.md")
-
-    @patch('urllib.request.urlopen')
-    def test_get_repo_files_recursive(self, mock_urlopen):
+    @patch('repository_crawler.get_session')
+    def test_get_repo_files_single_file(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.get.return_value = self._mock_response(data=[
+            {"type": "file", "path": "README.md", "download_url": "https://...", "size": 1}
+        ])
+        mock_get_session.return_value = mock_session
+
+        output = io.BytesIO()
+        asyncio.run(get_repo_files("test", "repo", "token", "", output))
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(lines, [["README.md", "https://...", 1]])
+
+    @patch('repository_crawler.get_session')
+    def test_get_repo_files_recursive(self, mock_get_session):
         # 第一次响应：包含文件和目录
-        mock_response1 = MagicMock()
-        mock_response1.status = 200
-        mock_response1.read.return_value = b'''[
-            {"type": "dir", "path": "src"},
-            {"type": "file", "path": "README.md"}
-        ]'''
-        
+        mock_response1 = self._mock_response(data=[
+            {"type": "dir", "path": "src", "name": "src"},
+            {"type": "file", "path": "README.md", "download_url": "https://...", "size": 1}
+        ])
         # 第二次响应：目录内容
-        mock_response2 = MagicMock()
-        mock_response2.status = 200
-        mock_response2.read.return_value = b'''[
-            {"type": "file", "path": "src/main.py"}
-        ]'''
-        mock_response2.headers = {'Link': ''}
+        mock_response2 = self._mock_response(data=[
+            {"type": "file", "path": "src/main.py", "download_url": "https://...", "size": 2}
+        ])
+        mock_session = self._mock_session()
+        mock_session.get.side_effect = [mock_response1, mock_response2]
+        mock_get_session.return_value = mock_session
         
-        mock_urlopen.side_effect = [mock_response1, mock_response2]
-        
-        files = get_repo_files("test", "repo", "token")
-        self.assertEqual(len(files), 2)
-        self.assertEqual(files[1]['path'], "src/main.py")
+        output = io.BytesIO()
+        asyncio.run(get_repo_files("test", "repo", "token", "", output))
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1][0], "src/main.py")
+        self.assertTrue(mock_session.get.call_args_list[1][0][0].endswith("/contents/src"))
+
+    @patch('repository_crawler.get_session')
+    def test_get_repo_files_escapes_path_segments(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.get.side_effect = [
+            self._mock_response(data=[{"type": "dir", "path": "c#/50%", "name": "50%"}]),
+            self._mock_response(data=[])
+        ]
+        mock_get_session.return_value = mock_session
+
+        asyncio.run(get_repo_files("test", "repo", "token", "c#", io.BytesIO()))
+        urls = [call[0][0] for call in mock_session.get.call_args_list]
+        self.assertTrue(urls[0].endswith("/contents/c%23"))
+        self.assertTrue(urls[1].endswith("/contents/c%23/50%25"))
+
+    @patch('repository_crawler.get_session')
+    def test_get_repo_files_skips_excluded_dirs(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.get.return_value = self._mock_response(data=[
+            {"type": "dir", "path": "node_modules", "name": "node_modules"},
+            {"type": "file", "path": "README.md", "download_url": "https://...", "size": 1}
+        ])
+        mock_get_session.return_value = mock_session
+
+        output = io.BytesIO()
+        asyncio.run(get_repo_files("test", "repo", "token", "", output,
+                                   crawl_filter=CrawlFilter(exclude_dirs=["node_modules"])))
+        self.assertEqual(mock_session.get.call_count, 1)
+        self.assertEqual(len(output.getvalue().splitlines()), 1)
+
+    @patch('repository_crawler.get_session')
+    def test_get_repo_files_worker_error(self, mock_get_session):
+        # 子目录列表格式异常时应抛出异常而不是让队列挂起
+        mock_session = self._mock_session()
+        mock_session.get.side_effect = [
+            self._mock_response(data=[{"type": "dir", "path": "src", "name": "src"}]),
+            self._mock_response(data=[{"path": "src/broken"}])
+        ]
+        mock_get_session.return_value = mock_session
+
+        with self.assertRaises(KeyError):
+            asyncio.run(get_repo_files("test", "repo", "token", "", io.BytesIO(), workers=4))
+
+    @patch('repository_crawler.get_session')
+    def test_get_repo_tree_recursive(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.get.side_effect = [
+            self._mock_response(data={"object": {"sha": "c0ffee"}}),
+            self._mock_response(data={"truncated": False, "tree": [
+                {"type": "tree", "path": "src", "sha": "t1"},
+                {"type": "blob", "path": "src/main.py", "sha": "b1", "size": 2},
+                {"type": "commit", "path": "third_party", "sha": "s1"}
+            ]})
+        ]
+        mock_get_session.return_value = mock_session
+
+        output = io.BytesIO()
+        asyncio.run(get_repo_tree("test", "repo", "token", output, branch="main"))
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(lines, [[
+            "src/main.py",
+            "https://raw.githubusercontent.com/test/repo/main/src/main.py",
+            2
+        ]])
+        self.assertTrue(mock_session.get.call_args_list[1][0][0].endswith("/git/trees/c0ffee?recursive=1"))
+
+    @patch('repository_crawler.get_session')
+    def test_get_repo_tree_truncated(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.get.side_effect = [
+            self._mock_response(data={"object": {"sha": "c0ffee"}}),
+            # 递归结果被截断
+            self._mock_response(data={"truncated": True, "tree": []}),
+            # 退回到只取根目录一层
+            self._mock_response(data={"truncated": False, "tree": [
+                {"type": "blob", "path": "README.md", "sha": "b0", "size": 1},
+                {"type": "tree", "path": "src", "sha": "t1"}
+            ]}),
+            # 子树单独递归获取
+            self._mock_response(data={"truncated": False, "tree": [
+                {"type": "blob", "path": "main.py", "sha": "b1", "size": 2}
+            ]})
+        ]
+        mock_get_session.return_value = mock_session
+
+        output = io.BytesIO()
+        asyncio.run(get_repo_tree("test", "repo", "token", output, branch="main"))
+        paths = [json.loads(line)[0] for line in output.getvalue().splitlines()]
+        self.assertEqual(paths, ["README.md", "src/main.py"])
+
+    @patch('repository_crawler.get_session')
+    def test_get_repo_tree_graphql(self, mock_get_session):
+        mock_session = self._mock_session()
+        mock_session.post = AsyncMock(return_value=self._mock_response(data={"data": {"repository": {
+            "object": {"oid": "t0", "entries": [
+                {"path": "README.md", "type": "blob", "object": {"byteSize": 1}},
+                {"path": "src", "type": "tree", "object": {"oid": "t1", "entries": [
+                    {"path": "src/main.py", "type": "blob", "object": {"byteSize": 2}}
+                ]}},
+                # 超出查询深度的子树只返回oid
+                {"path": "deep", "type": "tree", "object": {"oid": "t2"}}
+            ]}
+        }}}))
+        # 退回Trees API获取深层子树
+        mock_session.get.return_value = self._mock_response(data={"truncated": False, "tree": [
+            {"type": "blob", "path": "a/b.py", "sha": "b2", "size": 3}
+        ]})
+        mock_get_session.return_value = mock_session
+
+        output = io.BytesIO()
+        asyncio.run(get_repo_tree_graphql("test", "repo", "token", output, branch="main"))
+        paths = [json.loads(line)[0] for line in output.getvalue().splitlines()]
+        self.assertEqual(sorted(paths), ["README.md", "deep/a/b.py", "src/main.py"])
+        self.assertTrue(mock_session.get.call_args[0][0].endswith("/git/trees/t2?recursive=1"))
+
+    @patch('repository_crawler.get_session')
+    def test_get_repo_tree_graphql_falls_back_on_error(self, mock_get_session):
+        # GraphQL查询超时等错误时整仓库改用Trees API，而不是只留下元数据头
+        mock_session = self._mock_session()
+        mock_session.post = AsyncMock(return_value=self._mock_response(data={
+            "data": None,
+            "errors": [{"message": "Something went wrong while executing your query."}]
+        }))
+        mock_session.get.side_effect = [
+            self._mock_response(data={"object": {"sha": "c0ffee"}}),
+            self._mock_response(data={"truncated": False, "tree": [
+                {"type": "blob", "path": "README.md", "sha": "b0", "size": 1}
+            ]})
+        ]
+        mock_get_session.return_value = mock_session
+
+        output = io.BytesIO()
+        with patch('builtins.print'):
+            asyncio.run(get_repo_tree_graphql("test", "repo", "token", output, branch="main"))
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(lines, [
+            ["README.md", "https://raw.githubusercontent.com/test/repo/main/README.md", 1]
+        ])
+        self.assertTrue(mock_session.get.call_args_list[0][0][0].endswith("/git/refs/heads/main"))
+
+    @patch('repository_crawler.asyncio.create_subprocess_exec')
+    def test_get_repo_tree_git(self, mock_exec):
+        clone = MagicMock(returncode=0)
+        clone.communicate = AsyncMock(return_value=(b'', b''))
+        ls_tree = MagicMock(returncode=0)
+        ls_tree.communicate = AsyncMock(return_value=(
+            b'100644 blob b0\tREADME.md\0'
+            b'160000 commit s1\tthird_party\0'
+            b'100644 blob b1\tsrc/main.py\0', b''
+        ))
+        mock_exec.side_effect = [clone, ls_tree]
+
+        output = io.BytesIO()
+        asyncio.run(get_repo_tree_git("test", "repo", "secret", output, branch="main"))
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(lines, [
+            ["README.md", "https://raw.githubusercontent.com/test/repo/main/README.md", None],
+            ["src/main.py", "https://raw.githubusercontent.com/test/repo/main/src/main.py", None]
+        ])
+        # token只通过环境变量传递，不出现在命令行参数中
+        clone_args = mock_exec.call_args_list[0][0]
+        self.assertIn('--filter=blob:none', clone_args)
+        self.assertFalse(any('secret' in arg for arg in clone_args))
+
+    def test_record_writer_batches(self):
+        output = MagicMock()
+
+        async def write_records():
+            async with RecordWriter(output, batch_size=2) as writer:
+                for i in range(3):
+                    await writer.put((f"file{i}.py", "https://...", i))
+
+        asyncio.run(write_records())
+        # 满一批写一次，退出时再写出剩余记录
+        self.assertEqual(output.writelines.call_count, 2)
+        written = [line for call in output.writelines.call_args_list for line in call[0][0]]
+        self.assertEqual([json.loads(line)[0] for line in written], ["file0.py", "file1.py", "file2.py"])
 
     # 测试结果保存模块
     @patch("builtins.open", new_callable=mock_open)
@@ -133,39 +487,133 @@ class TestRepositoryCrawler(unittest.TestCase):
         mock_datetime = MagicMock()
         mock_datetime.now.return_value.isoformat.return_value = "2023-01-01T00:00:00"
         
-        with patch('repository_crawler.datetime', mock_datetime):
+        with patch('repository_crawler.datetime', mock_datetime), \
+             patch('repository_crawler.OUTPUT_DIR', self.OUTPUT_DIR):
             save_crawl_result(
                 "test", "repo", 
                 {"html_url": "https://github.com/test/repo"}, 
-                [{"path": "README.md"}]
+                [{"path": "README.md", "download_url": "https://...", "size": 1}]
             )
             
         mock_file.assert_called_once_with(
-            os.path.join(self.OUTPUT_DIR, "test_repo.json"), 'w'
+            os.path.join(self.OUTPUT_DIR, "test_repo.json"), 'wb', buffering=1 << 20
         )
-        result = json.loads(mock_file().write.call_args[0][0])
-        self.assertEqual(result['repo_info']['html_url'], "https://github.com/test/repo")
-        self.assertEqual(result['files'][0]['path'], "README.md")
-        self.assertEqual(result['crawl_timestamp'], "2023-01-01T00:00:00")
+        header, record = [json.loads(call[0][0]) for call in mock_file().write.call_args_list]
+        self.assertEqual(header['repo_info']['html_url'], "https://github.com/test/repo")
+        self.assertEqual(header['crawl_timestamp'], "2023-01-01T00:00:00")
+        self.assertEqual(header['file_fields'], ["path", "download_url", "size"])
+        self.assertEqual(record, ["README.md", "https://...", 1])
 
     # 测试主流程
-    @patch('repository_crawler.get_github_repo')
-    @patch('repository_crawler.get_repo_files')
-    @patch('repository_crawler.save_crawl_result')
-    def test_main_success(self, mock_save, mock_files, mock_repo):
-        mock_repo.return_value = {"name": "test_repo"}
-        mock_files.return_value = [{"path": "README.md"}]
+    @patch('repository_crawler.close_response_cache')
+    @patch('repository_crawler.open_response_cache')
+    @patch('repository_crawler.close_session', new_callable=AsyncMock)
+    @patch('repository_crawler.get_github_repo', new_callable=AsyncMock)
+    @patch('repository_crawler.load_config')
+    def test_main_success(self, mock_config, mock_repo, mock_close,
+                          mock_open_cache, mock_close_cache):
+        mock_tree = AsyncMock()
+        mock_config.return_value = {
+            'github': {'token': 'test_token'},
+            'crawl_repos': ['baidu/ERNIE-X1', 'tensorflow/tensorflow']
+        }
+        mock_repo.return_value = {
+            "name": "test_repo",
+            "html_url": "https://github.com/test/repo",
+            "default_branch": "main"
+        }
         
-        with patch('builtins.print') as mock_print, \
-             patch('repository_crawler.CONFIG_PATH', self.CONFIG_PATH), \
+        with patch.dict('repository_crawler.CRAWL_BACKENDS', {'trees': mock_tree}), \
+             patch('builtins.print') as mock_print, \
+             patch('builtins.open', mock_open()), \
+             patch('repository_crawler.os.makedirs'), \
              patch('repository_crawler.OUTPUT_DIR', self.OUTPUT_DIR):
             
             main()
             
             self.assertEqual(mock_repo.call_count, 2)  # 两个仓库
+            self.assertEqual(mock_tree.call_count, 2)
+            mock_close.assert_awaited()
+            mock_open_cache.assert_called_once()
+            mock_close_cache.assert_called_once()
+            mock_print.assert_any_call("\nCrawler completed successfully!")
+
+    @patch('repository_crawler.close_response_cache')
+    @patch('repository_crawler.open_response_cache')
+    @patch('repository_crawler.close_session', new_callable=AsyncMock)
+    @patch('repository_crawler.get_github_repo', new_callable=AsyncMock)
+    @patch('repository_crawler.load_config')
+    def test_main_limits_concurrent_repos(self, mock_config, mock_repo, mock_close,
+                                          mock_open_cache, mock_close_cache):
+        mock_config.return_value = {
+            'github': {'token': 'test_token'},
+            'crawl_repos': [f'owner/repo{i}' for i in range(5)]
+        }
+        mock_repo.return_value = {
+            "name": "test_repo",
+            "html_url": "https://github.com/test/repo",
+            "default_branch": "main"
+        }
+        running = 0
+        peak = 0
+        finished = []
+
+        async def tracking_backend(owner, repo_name, *args, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            # 让出事件循环若干次，使其他仓库有机会并发进入
+            for _ in range(5):
+                await asyncio.sleep(0)
+            running -= 1
+            finished.append(repo_name)
+
+        with patch.dict('repository_crawler.CRAWL_BACKENDS', {'trees': tracking_backend}), \
+             patch('repository_crawler.MAX_CONCURRENT_REPOS', 2), \
+             patch('builtins.print'), \
+             patch('builtins.open', mock_open()), \
+             patch('repository_crawler.os.makedirs'), \
+             patch('repository_crawler.OUTPUT_DIR', self.OUTPUT_DIR):
+            
+            main()
+            
+            self.assertEqual(len(finished), 5)
+            self.assertEqual(peak, 2)
+
+    @patch('repository_crawler.close_response_cache')
+    @patch('repository_crawler.open_response_cache')
+    @patch('repository_crawler.close_session', new_callable=AsyncMock)
+    @patch('repository_crawler.get_github_repo', new_callable=AsyncMock)
+    @patch('repository_crawler.get_repo_files', new_callable=AsyncMock)
+    @patch('repository_crawler.load_config')
+    def test_main_contents_backend(self, mock_config, mock_files, mock_repo, mock_close,
+                                   mock_open_cache, mock_close_cache):
+        mock_config.return_value = {
+            'github': {'token': 'test_token'},
+            'crawl_repos': ['baidu/ERNIE-X1', 'tensorflow/tensorflow'],
+            'crawl_backend': 'contents',
+            'crawl_filters': {'exclude_dirs': ['node_modules']}
+        }
+        mock_repo.return_value = {
+            "name": "test_repo",
+            "html_url": "https://github.com/test/repo",
+            "default_branch": "main"
+        }
+        
+        with patch('builtins.print'), \
+             patch('builtins.open', mock_open()), \
+             patch('repository_crawler.os.makedirs'), \
+             patch('repository_crawler.OUTPUT_DIR', self.OUTPUT_DIR):
+            
+            main()
+            
+            # contents 后端从根目录遍历，并带上配置的过滤规则
             self.assertEqual(mock_files.call_count, 2)
-            mock_save.assert_called()
-            mock_print.assert_any_call("Crawler completed successfully!")
+            for call in mock_files.call_args_list:
+                self.assertEqual(call[0][2:4], ('test_token', ''))
+                self.assertEqual(call[1]['crawl_filter'].exclude_dirs, frozenset(['node_modules']))
+            self.assertEqual(sorted(call[0][:2] for call in mock_files.call_args_list),
+                             [('baidu', 'ERNIE-X1'), ('tensorflow', 'tensorflow')])
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
\ No newline at end of file